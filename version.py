@@ -1,9 +1,503 @@
 import os
+import re
 import json
+import mmap
+import time
+import struct
 import hashlib
 import shutil
 import fnmatch
-from typing import List, Dict, Optional
+import tempfile
+import functools
+import operator
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Object-id hash functions, keyed by the name stored in .gitclone/config
+HASH_ALGORITHMS = {
+    'sha256': hashlib.sha256,
+    'blake2b': functools.partial(hashlib.blake2b, digest_size=32),
+}
+if blake3 is not None:
+    HASH_ALGORITHMS['blake3'] = blake3.blake3
+
+DEFAULT_HASH_ALGORITHM = 'blake3' if blake3 is not None else 'blake2b'
+
+# Repositories created before the config file existed used SHA-256
+LEGACY_HASH_ALGORITHM = 'sha256'
+
+# Binary layout of the index and of the file list in commit objects:
+# magic, entry count, then per entry the raw hash, path length and path.
+# The staging area also records each file's mtime, size and inode so
+# unchanged files can be staged again without rehashing them.
+INDEX_MAGIC = b'GCI1'
+STAT_INDEX_MAGIC = b'GCI2'
+_PACKED_MAGICS = (INDEX_MAGIC, STAT_INDEX_MAGIC)
+_INDEX_HEADER = struct.Struct('<4sI')
+_INDEX_ENTRY = struct.Struct('<32sH')
+_STAT_INDEX_ENTRY = struct.Struct('<32sqQQH')
+
+# Files larger than this are hashed with BLAKE3's multithreaded mmap path
+LARGE_FILE_THRESHOLD = 1 << 20
+
+# Files up to this size are hashed in batches of HASH_BATCH_SIZE per task,
+# so the executor's per-task overhead is not paid for every small file
+SMALL_FILE_THRESHOLD = 64 << 10
+HASH_BATCH_SIZE = 64
+
+# When zstandard is installed, file objects are stored compressed as
+# objects/<hash>.zst, either standalone or as a delta against an earlier
+# object named in a 'BASE:<hash>' header line
+COMPRESSED_SUFFIX = '.zst'
+DELTA_HEADER = b'BASE:'
+ZSTD_LEVEL = 3
+
+# Number of earlier objects tried as a delta base, and the longest chain
+# of deltas a reader may have to resolve
+DELTA_WINDOW = 10
+MAX_DELTA_DEPTH = 10
+
+# At ZSTD_LEVEL the matcher only reaches about this far back into a base,
+# so deltas are not tried when the file or the base is any larger
+DELTA_MAX_SIZE = 1 << 20
+
+# Fixed-width commit-graph records: commit hash, parent hash (zeros for a
+# root commit), timestamp, and the offset and length of the message in
+# the commit-graph-strings file
+COMMIT_GRAPH_RECORD = struct.Struct('<32s32sdII')
+_NO_PARENT = bytes(32)
+
+# Bloom filter of the paths each commit changed, kept in the commit
+# object and, one filter per commit-graph record, in commit-graph-bloom
+BLOOM_BITS = 1024
+BLOOM_HASHES = 7
+BLOOM_BYTES = BLOOM_BITS // 8
+# Stands in for commits recorded before filters existed, matches every path
+_FULL_BLOOM = b'\xff' * BLOOM_BYTES
+
+# Start method for hashing worker processes. A forked child inherits
+# BLAKE3's thread pool without its threads and would wait on it forever.
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Linux ioctl that makes a file share another file's extents (a reflink)
+FICLONE = 0x40049409
+
+
+def _json_dumps(obj) -> bytes:
+    """
+    Serialize an object to compact JSON, using orjson when it is installed.
+    
+    :param obj: Object to serialize
+    :return: UTF-8 encoded JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def _json_loads(data: bytes):
+    """
+    Deserialize JSON, using orjson when it is installed.
+    
+    :param data: UTF-8 encoded JSON
+    :return: Deserialized object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _pack_entries(entries: List[Dict], with_stat: bool = False) -> bytes:
+    """
+    Serialize index entries into the packed binary format.
+    
+    :param entries: Entries with 'path' and 'hash' keys
+    :param with_stat: Also store the 'mtime_ns', 'size' and 'inode' keys
+    :return: Packed entries
+    """
+    magic = STAT_INDEX_MAGIC if with_stat else INDEX_MAGIC
+    buf = bytearray(_INDEX_HEADER.pack(magic, len(entries)))
+    for entry in entries:
+        path = os.fsencode(entry['path'])
+        raw_hash = bytes.fromhex(entry['hash'])
+        if with_stat:
+            buf += _STAT_INDEX_ENTRY.pack(raw_hash, entry.get('mtime_ns', 0),
+                                          entry.get('size', 0), entry.get('inode', 0), len(path))
+        else:
+            buf += _INDEX_ENTRY.pack(raw_hash, len(path))
+        buf += path
+    return bytes(buf)
+
+
+def _unpack_entries(data: bytes) -> List[Dict]:
+    """
+    Deserialize entries written by _pack_entries.
+    
+    :param data: Packed entries, as bytes or a memory map
+    :return: Entries with 'path' and 'hash' keys, plus the stat keys if stored
+    """
+    # Released on exit so a memory map passed in can be closed afterwards
+    with memoryview(data) as mv:
+        magic, count = _INDEX_HEADER.unpack_from(mv)
+        if magic not in _PACKED_MAGICS:
+            raise ValueError("Not a packed index")
+        
+        entries = []
+        offset = _INDEX_HEADER.size
+        for _ in range(count):
+            if magic == STAT_INDEX_MAGIC:
+                raw_hash, mtime_ns, size, inode, length = _STAT_INDEX_ENTRY.unpack_from(mv, offset)
+                offset += _STAT_INDEX_ENTRY.size
+                entry = {'mtime_ns': mtime_ns, 'size': size, 'inode': inode}
+            else:
+                raw_hash, length = _INDEX_ENTRY.unpack_from(mv, offset)
+                offset += _INDEX_ENTRY.size
+                entry = {}
+            entry['path'] = os.fsdecode(bytes(mv[offset:offset + length]))
+            entry['hash'] = raw_hash.hex()
+            entries.append(entry)
+            offset += length
+        return entries
+
+
+def _hash_file(data, algorithm: str) -> str:
+    """
+    Compute the hash of file contents.
+    
+    :param data: Contents of the file, usually a memory map of it
+    :param algorithm: Name of the hash algorithm to use
+    :return: Hex digest of the file contents
+    """
+    if algorithm == 'blake3' and len(data) > LARGE_FILE_THRESHOLD:
+        # Hash large files as a parallel tree
+        return blake3.blake3(data, max_threads=blake3.blake3.AUTO).hexdigest()
+    
+    return HASH_ALGORITHMS[algorithm](data).hexdigest()
+
+
+def _copy_fd(fd: int, size: int, dest: str):
+    """
+    Copy an open file to a new path without a userspace read/write loop.
+    
+    The copy is written to a temporary file and renamed into place, so an
+    interrupted copy never leaves a truncated object behind.
+    
+    :param fd: Open file descriptor of the source
+    :param size: Size of the source in bytes
+    :param dest: Destination path
+    """
+    dest_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest))
+    try:
+        os.fchmod(dest_fd, 0o644)
+        offset = 0
+        try:
+            # Copies in the kernel, sharing extents on copy-on-write filesystems
+            while offset < size:
+                copied = os.copy_file_range(fd, dest_fd, size - offset, offset, offset)
+                if copied == 0:
+                    break
+                offset += copied
+        except (AttributeError, OSError):
+            # copy_file_range() is Linux-only and refuses some file pairs
+            try:
+                while offset < size:
+                    sent = os.sendfile(dest_fd, fd, offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+            except OSError:
+                # sendfile() cannot target regular files on this platform
+                os.lseek(fd, offset, os.SEEK_SET)
+                os.lseek(dest_fd, offset, os.SEEK_SET)
+                while chunk := os.read(fd, 1 << 16):
+                    os.write(dest_fd, chunk)
+    except BaseException:
+        os.close(dest_fd)
+        os.unlink(tmp_path)
+        raise
+    
+    os.close(dest_fd)
+    os.replace(tmp_path, dest)
+
+
+def _write_object(dest: str, data: bytes):
+    """
+    Atomically write an object file.
+    
+    :param dest: Destination path
+    :param data: Contents of the object
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest))
+    try:
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    
+    os.replace(tmp_path, dest)
+
+
+def _bloom_positions(path: str) -> List[int]:
+    """
+    Compute the bits a path sets in a changed-path Bloom filter.
+    
+    :param path: Path of the file, relative to the repository
+    :return: Bit positions
+    """
+    digest = hashlib.blake2b(os.fsencode(path), digest_size=8).digest()
+    h1 = int.from_bytes(digest[:4], 'little')
+    h2 = int.from_bytes(digest[4:], 'little') | 1
+    return [(h1 + i * h2) % BLOOM_BITS for i in range(BLOOM_HASHES)]
+
+
+def _bloom_filter(paths: List[str]) -> bytes:
+    """
+    Build a changed-path Bloom filter.
+    
+    :param paths: Paths of the changed files
+    :return: The filter
+    """
+    bloom = bytearray(BLOOM_BYTES)
+    for path in paths:
+        for bit in _bloom_positions(path):
+            bloom[bit >> 3] |= 1 << (bit & 7)
+    return bytes(bloom)
+
+
+def _bloom_maybe_contains(bloom: bytes, path: str) -> bool:
+    """
+    Check if a path may be in a changed-path Bloom filter.
+    
+    :param bloom: The filter
+    :param path: Path of the file, relative to the repository
+    :return: False if the path is definitely not in the filter, True otherwise
+    """
+    return all(bloom[bit >> 3] & (1 << (bit & 7)) for bit in _bloom_positions(path))
+
+
+def _reflink_or_copy(src: str, dest: str):
+    """
+    Copy a file, sharing its extents when the filesystem supports reflinks.
+    
+    :param src: Source path
+    :param dest: Destination path
+    """
+    if fcntl is not None:
+        try:
+            with open(src, 'rb') as s, open(dest, 'wb') as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            shutil.copystat(src, dest)
+            return
+        except OSError:
+            pass
+    
+    shutil.copy2(src, dest)
+
+
+def _object_exists(objects_dir: str, object_hash: str) -> bool:
+    """
+    Check if a file object is stored, either as-is or compressed.
+    
+    :param objects_dir: Path to the objects directory
+    :param object_hash: Hash of the object
+    :return: True if the object is stored, False otherwise
+    """
+    object_path = f"{objects_dir}/{object_hash}"
+    return os.path.exists(object_path) or os.path.exists(object_path + COMPRESSED_SUFFIX)
+
+
+def _delta_depth(objects_dir: str, object_hash: str) -> int:
+    """
+    Count the deltas that must be applied to rebuild a file object.
+    
+    :param objects_dir: Path to the objects directory
+    :param object_hash: Hash of the object
+    :return: Length of the delta chain, 0 for standalone objects
+    """
+    depth = 0
+    while True:
+        try:
+            with open(f"{objects_dir}/{object_hash}{COMPRESSED_SUFFIX}", 'rb') as f:
+                head = f.read(len(DELTA_HEADER) + 65)
+        except FileNotFoundError:
+            return depth
+        
+        if not head.startswith(DELTA_HEADER):
+            return depth
+        
+        object_hash = head[len(DELTA_HEADER):].split(b'\n', 1)[0].decode()
+        depth += 1
+
+
+def _blob_size(objects_dir: str, object_hash: str) -> int:
+    """
+    Get the size of a file object's contents without rebuilding it.
+    
+    :param objects_dir: Path to the objects directory
+    :param object_hash: Hash of the object
+    :return: Size of the contents in bytes, -1 if a compressed frame does not record it
+    """
+    object_path = f"{objects_dir}/{object_hash}"
+    try:
+        with open(object_path + COMPRESSED_SUFFIX, 'rb') as f:
+            # Room for a delta header line and a zstd frame header (at most 18 bytes)
+            head = f.read(len(DELTA_HEADER) + 65 + 18)
+    except FileNotFoundError:
+        return os.path.getsize(object_path)
+    
+    if head.startswith(DELTA_HEADER):
+        head = head.partition(b'\n')[2]
+    return zstandard.frame_content_size(head)
+
+
+def _read_blob(objects_dir: str, object_hash: str) -> bytes:
+    """
+    Read the contents of a file object, resolving any delta chain.
+    
+    :param objects_dir: Path to the objects directory
+    :param object_hash: Hash of the object
+    :return: Contents of the file
+    """
+    object_path = f"{objects_dir}/{object_hash}"
+    try:
+        with open(object_path + COMPRESSED_SUFFIX, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        with open(object_path, 'rb') as f:
+            return f.read()
+    
+    if zstandard is None:
+        raise RuntimeError("The zstandard package is required to read compressed objects")
+    
+    if not data.startswith(DELTA_HEADER):
+        return zstandard.ZstdDecompressor().decompress(data)
+    
+    header, _, frame = data.partition(b'\n')
+    base = _read_blob(objects_dir, header[len(DELTA_HEADER):].decode())
+    dict_data = zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+    return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(frame)
+
+
+def _compress_blob(data: bytes, objects_dir: str, bases: List[str]) -> bytes:
+    """
+    Compress file contents, as a delta against an earlier object if that is smaller.
+    
+    :param data: Contents of the file
+    :param objects_dir: Path to the objects directory
+    :param bases: Hashes of candidate delta bases, most similar first
+    :return: Contents of the compressed object
+    """
+    best = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if len(data) > DELTA_MAX_SIZE:
+        return best
+    
+    for base_hash in bases:
+        try:
+            # Checked before the base is rebuilt, which is the costly part
+            if not 0 <= _blob_size(objects_dir, base_hash) <= DELTA_MAX_SIZE:
+                continue
+        except FileNotFoundError:
+            continue
+        
+        if _delta_depth(objects_dir, base_hash) >= MAX_DELTA_DEPTH:
+            continue
+        
+        try:
+            base = _read_blob(objects_dir, base_hash)
+        except FileNotFoundError:
+            continue
+        
+        if not base:
+            # An empty dictionary cannot be loaded
+            continue
+        
+        dict_data = zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+        delta = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data).compress(data)
+        delta = DELTA_HEADER + base_hash.encode() + b'\n' + delta
+        if len(delta) < len(best):
+            best = delta
+    
+    return best
+
+
+def _hash_and_store(file: str, full_path: str, objects_dir: str, algorithm: str,
+                    bases: List[str]) -> Tuple[str, str]:
+    """
+    Hash a file and store it in the object database.
+    
+    Lives at module level so it can be shipped to worker processes.
+    
+    :param file: Path of the file relative to the repository
+    :param full_path: Absolute path to the file
+    :param objects_dir: Path to the objects directory
+    :param algorithm: Name of the hash algorithm to use
+    :param bases: Hashes of candidate delta bases, most similar first
+    :return: The relative path and the file hash
+    """
+    fd = os.open(full_path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        
+        # Map the file once, hashing and compression both read the mapping
+        # (empty files cannot be memory-mapped)
+        data = mmap.mmap(fd, 0, access=mmap.ACCESS_READ) if size else b''
+        try:
+            # Compute file hash
+            file_hash = _hash_file(data, algorithm)
+            
+            # Store file object, unless this content is already stored
+            object_path = f"{objects_dir}/{file_hash}"
+            if not _object_exists(objects_dir, file_hash):
+                if zstandard is None:
+                    _copy_fd(fd, size, object_path)
+                else:
+                    _write_object(object_path + COMPRESSED_SUFFIX, _compress_blob(data, objects_dir, bases))
+        finally:
+            if size:
+                data.close()
+    finally:
+        os.close(fd)
+    
+    return file, file_hash
+
+
+def _hash_and_store_batch(jobs: List[Tuple[str, str, List[str]]], objects_dir: str,
+                          algorithm: str) -> List[Tuple[str, str]]:
+    """
+    Hash and store a batch of files in a single worker task.
+    
+    :param jobs: Relative path, absolute path and candidate delta bases of each file
+    :param objects_dir: Path to the objects directory
+    :param algorithm: Name of the hash algorithm to use
+    :return: The relative path and the file hash of each file
+    """
+    return [_hash_and_store(file, full_path, objects_dir, algorithm, bases)
+            for file, full_path, bases in jobs]
+
 
 class Repository:
     def __init__(self, path: str):
@@ -15,9 +509,30 @@ class Repository:
         self.path = os.path.abspath(path)
         self.repo_dir = os.path.join(path, '.gitclone')
         
+        # Fixed locations inside the repository, joined once
+        self._objects_dir = os.path.join(self.repo_dir, 'objects')
+        self._heads_dir = os.path.join(self.repo_dir, 'refs', 'heads')
+        self._head_path = os.path.join(self.repo_dir, 'HEAD')
+        self._index_path = os.path.join(self.repo_dir, 'index')
+        self._ignore_path = os.path.join(self.repo_dir, 'ignore')
+        self._config_path = os.path.join(self.repo_dir, 'config')
+        self._commit_graph_path = os.path.join(self.repo_dir, 'commit-graph')
+        self._commit_graph_strings_path = os.path.join(self.repo_dir, 'commit-graph-strings')
+        self._commit_graph_bloom_path = os.path.join(self.repo_dir, 'commit-graph-bloom')
+        
+        # Relative paths are joined onto this by plain concatenation
+        self._path_prefix = self.path + os.sep
+        
         if not os.path.exists(self.repo_dir):
             self._initialize_repo()
         
+        self.hash_algorithm = self._read_config().get('hash_algorithm', LEGACY_HASH_ALGORITHM)
+        if self.hash_algorithm not in HASH_ALGORITHMS:
+            raise RuntimeError(f"Hash algorithm {self.hash_algorithm} is not available")
+        self._hasher = HASH_ALGORITHMS[self.hash_algorithm]
+        
+        self._load_ignore_patterns()
+        
         self.current_branch = self._get_current_branch()
     
     def _initialize_repo(self):
@@ -25,24 +540,135 @@ class Repository:
         Create the repository structure and initial files.
         """
         os.makedirs(self.repo_dir)
-        os.makedirs(os.path.join(self.repo_dir, 'objects'))
-        os.makedirs(os.path.join(self.repo_dir, 'refs', 'heads'))
+        os.makedirs(self._objects_dir)
+        os.makedirs(self._heads_dir)
         
         # Create initial branch
-        with open(os.path.join(self.repo_dir, 'HEAD'), 'w') as f:
+        with open(self._head_path, 'w') as f:
             f.write('ref: refs/heads/main')
         
         # Create initial branch file
-        with open(os.path.join(self.repo_dir, 'refs', 'heads', 'main'), 'w') as f:
+        with open(f"{self._heads_dir}/main", 'w') as f:
             f.write('')
         
         # Create staging area
-        with open(os.path.join(self.repo_dir, 'index'), 'w') as f:
-            json.dump([], f)
+        self._write_index([])
         
         # Create .gitignore
-        with open(os.path.join(self.repo_dir, 'ignore'), 'w') as f:
+        with open(self._ignore_path, 'w') as f:
             f.write('.gitclone\n')
+        
+        # Record the object hash algorithm so later runs stay consistent
+        with open(self._config_path, 'w') as f:
+            json.dump({'hash_algorithm': DEFAULT_HASH_ALGORITHM}, f, indent=2)
+    
+    def _read_config(self) -> Dict:
+        """
+        Read the repository configuration.
+        
+        :return: Configuration values, empty for repositories without a config file
+        """
+        try:
+            with open(self._config_path, 'rb') as f:
+                return _json_loads(f.read())
+        except FileNotFoundError:
+            return {}
+    
+    def _read_index(self) -> List[Dict]:
+        """
+        Read the staging area.
+        
+        :return: Staged entries
+        """
+        with open(self._index_path, 'rb') as f:
+            data = f.read()
+        
+        if not data.startswith(_PACKED_MAGICS):
+            # Index written by an older version
+            return _json_loads(data)
+        
+        return _unpack_entries(data)
+    
+    def _write_index(self, index: List[Dict]):
+        """
+        Write the staging area.
+        
+        :param index: Staged entries
+        """
+        with open(self._index_path, 'wb') as f:
+            f.write(_pack_entries(index, with_stat=True))
+    
+    def _read_commit(self, commit_hash: str) -> Dict:
+        """
+        Read a commit object.
+        
+        :param commit_hash: Hash of the commit
+        :return: Commit data, with the hash of its tree or, for commits
+            written by older versions, the list of files sorted by path
+        """
+        with open(f"{self._objects_dir}/{commit_hash}", 'rb') as f:
+            data = f.read()
+        
+        commit_data = _json_loads(data)
+        if 'files' in commit_data:
+            # JSON commit written by an older version
+            commit_data['files'].sort(key=operator.itemgetter('path'))
+        if 'bloom' in commit_data:
+            commit_data['bloom'] = bytes.fromhex(commit_data['bloom'])
+        return commit_data
+    
+    def _write_commit(self, commit_hash: str, commit_data: Dict):
+        """
+        Write a commit object.
+        
+        :param commit_hash: Hash of the commit
+        :param commit_data: Commit data, with the hash of its tree and its changed-path filter
+        """
+        commit_data = dict(commit_data, bloom=commit_data['bloom'].hex())
+        _write_object(f"{self._objects_dir}/{commit_hash}", _json_dumps(commit_data))
+    
+    def _write_tree(self, files: List[Dict]) -> str:
+        """
+        Store the file list of a commit as a tree object.
+        
+        :param files: Entries with 'path' and 'hash' keys, sorted by path
+        :return: Hash of the tree
+        """
+        data = _pack_entries(files)
+        tree_hash = self._hasher(data).hexdigest()
+        
+        # Identical trees are only stored once
+        if not _object_exists(self._objects_dir, tree_hash):
+            _write_object(f"{self._objects_dir}/{tree_hash}", data)
+        return tree_hash
+    
+    def _commit_files(self, commit_data: Dict) -> List[Dict]:
+        """
+        Get the files of a commit.
+        
+        :param commit_data: Commit data as returned by _read_commit
+        :return: Entries with 'path' and 'hash' keys, sorted by path
+        """
+        if 'files' in commit_data:
+            return commit_data['files']
+        
+        return self._read_tree(commit_data['tree'])
+    
+    def _read_tree(self, tree_hash: str) -> List[Dict]:
+        """
+        Read a tree object, unpacking it straight out of a memory map.
+        
+        :param tree_hash: Hash of the tree
+        :return: Entries with 'path' and 'hash' keys, sorted by path
+        """
+        try:
+            f = open(f"{self._objects_dir}/{tree_hash}", 'rb')
+        except FileNotFoundError:
+            # Shares its hash with a compressed file object of the same bytes
+            return _unpack_entries(_read_blob(self._objects_dir, tree_hash))
+        
+        with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _unpack_entries(mm)
     
     def _get_current_branch(self) -> str:
         """
@@ -50,31 +676,35 @@ class Repository:
         
         :return: Current branch name
         """
-        with open(os.path.join(self.repo_dir, 'HEAD'), 'r') as f:
+        with open(self._head_path, 'r') as f:
             return f.read().split('/')[-1].strip()
     
-    def _should_ignore(self, path: str) -> bool:
+    def _load_ignore_patterns(self):
         """
-        Check if a file should be ignored based on .gitignore patterns.
-        
-        :param path: Path to the file
-        :return: True if file should be ignored, False otherwise
+        Read the .gitignore patterns and compile them into a single regex.
         """
-        relative_path = os.path.relpath(path, self.path)
-        
-        # Read ignore patterns
         try:
-            with open(os.path.join(self.repo_dir, 'ignore'), 'r') as f:
-                ignore_patterns = [line.strip() for line in f if line.strip()]
+            with open(self._ignore_path, 'r') as f:
+                self._ignore_patterns = [line.strip() for line in f if line.strip()]
         except FileNotFoundError:
-            ignore_patterns = []
+            self._ignore_patterns = []
         
-        # Check against ignore patterns
-        for pattern in ignore_patterns:
-            if fnmatch.fnmatch(relative_path, pattern):
-                return True
+        if self._ignore_patterns:
+            self._ignore_re = re.compile('(?:' + ')|(?:'.join(fnmatch.translate(p) for p in self._ignore_patterns) + ')')
+        else:
+            # Never matches
+            self._ignore_re = re.compile('(?!)')
+    
+    def _filter_ignored(self, paths: List[str]) -> set:
+        """
+        Find which of many files should be ignored based on .gitignore patterns.
         
-        return False
+        :param paths: Paths relative to the repository
+        :return: The subset of paths that should be ignored
+        """
+        # One regex scan per path, however many patterns there are
+        match = self._ignore_re.match
+        return {path for path in paths if match(path) is not None}
     
     def add(self, files: List[str]):
         """
@@ -83,45 +713,163 @@ class Repository:
         :param files: List of file paths to stage
         """
         # Read existing index
-        with open(os.path.join(self.repo_dir, 'index'), 'r') as f:
-            index = json.load(f)
+        index_mtime_ns = os.stat(self._index_path).st_mtime_ns
+        index = self._read_index()
+        cached = {}
+        for entry in index:
+            # An entry no older than the index may have changed again within
+            # the same mtime tick. Its stat data is smudged so it is rehashed
+            # even after the index is rewritten with a newer mtime.
+            if entry.get('mtime_ns', -1) >= index_mtime_ns:
+                entry['mtime_ns'] = -1
+            cached[entry['path']] = entry
         
+        full_paths = []
+        relative_paths = []
         for file in files:
-            full_path = os.path.join(self.path, file)
-            
+            if os.path.isabs(file):
+                full_paths.append(file)
+                relative_paths.append(os.path.relpath(file, self.path))
+            else:
+                full_paths.append(self._path_prefix + file)
+                # Only names like './x' or 'a/../x' need normalising to match
+                if file.startswith('.') or '/.' in file or '//' in file:
+                    relative_paths.append(os.path.normpath(file))
+                else:
+                    relative_paths.append(file)
+        ignored = self._filter_ignored(relative_paths)
+        
+        staged = []
+        file_hashes = {}
+        to_hash = []
+        hash_paths = []
+        hash_sizes = []
+        large = False
+        for file, full_path, relative_path in zip(files, full_paths, relative_paths):
             # Check if file exists and is not ignored
-            if not os.path.exists(full_path):
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                # Anything os.path.exists() would have reported as missing
                 print(f"Error: {file} does not exist")
                 continue
             
-            if self._should_ignore(full_path):
+            if relative_path in ignored:
                 print(f"Skipping ignored file: {file}")
                 continue
             
-            # Compute file hash
-            with open(full_path, 'rb') as f:
-                file_hash = hashlib.sha256(f.read()).hexdigest()
+            staged.append((file, st))
             
-            # Store file object
-            object_path = os.path.join(self.repo_dir, 'objects', file_hash)
-            shutil.copy(full_path, object_path)
+            # Reuse the staged hash if the file's stat data is unchanged
+            entry = cached.get(file)
+            if (entry is not None and 'mtime_ns' in entry
+                    and (entry['mtime_ns'], entry['size'], entry['inode']) == (st.st_mtime_ns, st.st_size, st.st_ino)):
+                file_hashes[file] = entry['hash']
+                continue
             
+            to_hash.append(file)
+            hash_paths.append(full_path)
+            hash_sizes.append(st.st_size)
+            large = large or st.st_size > LARGE_FILE_THRESHOLD
+        
+        if zstandard is not None:
+            delta_bases = self._find_delta_bases(to_hash, cached)
+        else:
+            delta_bases = [[] for _ in to_hash]
+        
+        # Group small files into batches, large files get a task each
+        batches = []
+        small = []
+        for file, full_path, bases, size in zip(to_hash, hash_paths, delta_bases, hash_sizes):
+            if size > SMALL_FILE_THRESHOLD:
+                batches.append([(file, full_path, bases)])
+                continue
+            
+            small.append((file, full_path, bases))
+            if len(small) == HASH_BATCH_SIZE:
+                batches.append(small)
+                small = []
+        if small:
+            batches.append(small)
+        
+        # Hash and store files in parallel
+        args = (batches,
+                itertools.repeat(self._objects_dir),
+                itertools.repeat(self.hash_algorithm))
+        if len(batches) < 2:
+            results = list(map(_hash_and_store_batch, *args))
+        else:
+            # Process startup only pays off once there is real hashing to do
+            if large:
+                executor = ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                               mp_context=multiprocessing.get_context(POOL_START_METHOD))
+            else:
+                executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+            with executor:
+                results = list(executor.map(_hash_and_store_batch, *args))
+        for batch_results in results:
+            file_hashes.update(batch_results)
+        
+        for file, st in staged:
             # Update index
             index_entry = {
                 'path': file,
-                'hash': file_hash
+                'hash': file_hashes[file],
+                'mtime_ns': st.st_mtime_ns,
+                'size': st.st_size,
+                'inode': st.st_ino
             }
             
-            # Remove existing entry if exists
-            index = [entry for entry in index if entry['path'] != file]
-            index.append(index_entry)
+            # Remove existing entry if exists, so the new one goes last
+            cached.pop(file, None)
+            cached[file] = index_entry
         
         # Write updated index
-        with open(os.path.join(self.repo_dir, 'index'), 'w') as f:
-            json.dump(index, f, indent=2)
+        self._write_index(list(cached.values()))
         
         print(f"Added {len(files)} file(s) to staging area")
     
+    def _find_delta_bases(self, files: List[str], cached: Dict[str, Dict]) -> List[List[str]]:
+        """
+        Pick earlier objects to try as delta bases for files being staged.
+        
+        The previous version of the same path is tried first, followed by
+        other objects with the same extension: those staged since the last
+        commit, most recently staged first, then those in the last commit.
+        
+        :param files: Paths of the files being staged
+        :param cached: Staged entries keyed by path
+        :return: Candidate base hashes for each file
+        """
+        previous = {}
+        last_commit = self._get_last_commit()
+        if last_commit:
+            last_files = self._commit_files(self._read_commit(last_commit))
+            previous.update((entry['path'], entry['hash']) for entry in last_files)
+        # Staged entries are in the order they were added, and go after the
+        # last commit's path-sorted files so they count as more recent
+        for path, entry in cached.items():
+            previous.pop(path, None)
+            previous[path] = entry['hash']
+        
+        by_suffix = {}
+        for path, object_hash in previous.items():
+            recent = by_suffix.setdefault(os.path.splitext(path)[1], [])
+            recent.append(object_hash)
+            if len(recent) > DELTA_WINDOW:
+                recent.pop(0)
+        
+        delta_bases = []
+        for file in files:
+            bases = [previous[file]] if file in previous else []
+            for object_hash in reversed(by_suffix.get(os.path.splitext(file)[1], [])):
+                if len(bases) >= DELTA_WINDOW:
+                    break
+                if object_hash not in bases:
+                    bases.append(object_hash)
+            delta_bases.append(bases)
+        return delta_bases
+    
     def commit(self, message: str):
         """
         Create a commit with staged files.
@@ -129,46 +877,150 @@ class Repository:
         :param message: Commit message
         """
         # Read index
-        with open(os.path.join(self.repo_dir, 'index'), 'r') as f:
-            index = json.load(f)
+        index = self._read_index()
         
         if not index:
             print("No changes to commit")
             return
         
-        # Create commit object
-        commit_hash = hashlib.sha256(message.encode()).hexdigest()
-        commit_path = os.path.join(self.repo_dir, 'objects', commit_hash)
+        # Sorted so diff can merge file lists without building dicts
+        files = sorted(index, key=operator.itemgetter('path'))
+        parent = self._get_last_commit()
+        
+        # Find the paths whose content changed since the parent
+        parent_hashes = {}
+        if parent:
+            parent_hashes = {entry['path']: entry['hash']
+                             for entry in self._commit_files(self._read_commit(parent))}
+        changed = [entry['path'] for entry in files if parent_hashes.get(entry['path']) != entry['hash']]
         
+        # Create commit object
         commit_data = {
             'message': message,
-            'timestamp': os.path.getctime(commit_path) if os.path.exists(commit_path) else os.time(),
-            'parent': self._get_last_commit(),
-            'files': index
+            'timestamp': time.time(),
+            'parent': parent,
+            'tree': self._write_tree(files),
+            'bloom': _bloom_filter(changed)
         }
         
+        # The id covers everything that identifies the commit, so commits
+        # with the same message no longer overwrite each other
+        commit_hash = self._hasher(b'\0'.join([
+            b'commit',
+            (commit_data['parent'] or '').encode(),
+            commit_data['tree'].encode(),
+            repr(commit_data['timestamp']).encode(),
+            message.encode()
+        ])).hexdigest()
+        
         # Write commit object
-        with open(commit_path, 'w') as f:
-            json.dump(commit_data, f, indent=2)
+        self._write_commit(commit_hash, commit_data)
+        self._append_commit_graph(commit_hash, commit_data)
         
         # Update branch reference
-        branch_path = os.path.join(self.repo_dir, 'refs', 'heads', self.current_branch)
+        branch_path = f"{self._heads_dir}/{self.current_branch}"
         with open(branch_path, 'w') as f:
             f.write(commit_hash)
         
         # Clear index
-        with open(os.path.join(self.repo_dir, 'index'), 'w') as f:
-            json.dump([], f)
+        self._write_index([])
         
         print(f"Committed {len(index)} changes: {message}")
     
+    def _append_commit_graph(self, commit_hash: str, commit_data: Dict):
+        """
+        Record a commit in the commit-graph sidecar.
+        
+        :param commit_hash: Hash of the commit
+        :param commit_data: Commit data
+        """
+        message = commit_data['message'].encode()
+        with open(self._commit_graph_strings_path, 'ab') as f:
+            offset = f.tell()
+            f.write(message)
+        
+        parent = commit_data['parent']
+        record = COMMIT_GRAPH_RECORD.pack(bytes.fromhex(commit_hash),
+                                          bytes.fromhex(parent) if parent else _NO_PARENT,
+                                          commit_data['timestamp'], offset, len(message))
+        with open(self._commit_graph_path, 'ab') as f:
+            # Drop a record left half-written by an interrupted commit
+            records = f.tell() // COMMIT_GRAPH_RECORD.size
+            f.truncate(records * COMMIT_GRAPH_RECORD.size)
+            
+            # Keep the filters in step with the graph records, written
+            # first so a record never exists without its filter
+            with open(self._commit_graph_bloom_path, 'ab') as bloom_file:
+                filters = bloom_file.tell() // BLOOM_BYTES
+                if filters > records:
+                    bloom_file.truncate(records * BLOOM_BYTES)
+                else:
+                    bloom_file.truncate(filters * BLOOM_BYTES)
+                    bloom_file.write(_FULL_BLOOM * (records - filters))
+                bloom_file.write(commit_data['bloom'])
+            
+            f.write(record)
+    
+    def _read_commit_graph(self) -> Dict[str, Dict]:
+        """
+        Read the commit-graph sidecar.
+        
+        :return: Message, timestamp, parent and changed-path filter of each
+            recorded commit, keyed by hash
+        """
+        try:
+            graph_file = open(self._commit_graph_path, 'rb')
+        except FileNotFoundError:
+            return {}
+        
+        with graph_file, open(self._commit_graph_strings_path, 'rb') as strings_file:
+            # Ignore a record left half-written by an interrupted commit
+            size = os.fstat(graph_file.fileno()).st_size
+            size -= size % COMMIT_GRAPH_RECORD.size
+            if size == 0:
+                return {}
+            
+            strings = strings_file.read()
+            blooms = self._map_commit_graph_blooms()
+            graph = {}
+            with mmap.mmap(graph_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                records = memoryview(mm)[:size]
+                try:
+                    for i, (commit, parent, timestamp, offset, length) in enumerate(
+                            COMMIT_GRAPH_RECORD.iter_unpack(records)):
+                        graph[commit.hex()] = {
+                            'message': strings[offset:offset + length].decode(),
+                            'timestamp': timestamp,
+                            'parent': parent.hex() if parent != _NO_PARENT else None,
+                            'bloom': blooms[i * BLOOM_BYTES:(i + 1) * BLOOM_BYTES] or _FULL_BLOOM
+                        }
+                finally:
+                    records.release()
+                    if isinstance(blooms, mmap.mmap):
+                        blooms.close()
+            return graph
+    
+    def _map_commit_graph_blooms(self):
+        """
+        Memory-map the changed-path filters of the commit-graph.
+        
+        :return: The mapped filters, or empty bytes if there are none
+        """
+        try:
+            with open(self._commit_graph_bloom_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return b''
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return b''
+    
     def _get_last_commit(self) -> Optional[str]:
         """
         Get the hash of the last commit on the current branch.
         
         :return: Commit hash or None if no previous commits
         """
-        branch_path = os.path.join(self.repo_dir, 'refs', 'heads', self.current_branch)
+        branch_path = f"{self._heads_dir}/{self.current_branch}"
         
         try:
             with open(branch_path, 'r') as f:
@@ -176,29 +1028,84 @@ class Repository:
         except FileNotFoundError:
             return None
     
-    def log(self):
+    def log(self, stat: bool = False):
         """
         Display commit history.
+        
+        :param stat: Also list the files of each commit, which requires
+            reading the commit and tree objects instead of just the commit-graph
         """
         current_commit = self._get_last_commit()
+        graph = self._read_commit_graph()
         
         while current_commit:
-            commit_path = os.path.join(self.repo_dir, 'objects', current_commit)
-            
             try:
-                with open(commit_path, 'r') as f:
-                    commit_data = json.load(f)
+                commit_data = graph.get(current_commit)
+                if commit_data is None or stat:
+                    # Commits made before the commit-graph existed
+                    commit_data = self._read_commit(current_commit)
                 
                 print(f"Commit: {current_commit}")
                 print(f"Message: {commit_data['message']}")
                 print(f"Timestamp: {commit_data['timestamp']}")
-                print(f"Files: {[file['path'] for file in commit_data['files']]}")
+                if stat:
+                    print(f"Files: {[file['path'] for file in self._commit_files(commit_data)]}")
                 print("---")
                 
                 current_commit = commit_data.get('parent')
             except FileNotFoundError:
                 break
     
+    def log_path(self, path: str):
+        """
+        Display the commits that changed a file.
+        
+        Commits whose changed-path filter rules the file out are skipped
+        without reading their commit or tree objects.
+        
+        :param path: Path of the file, relative to the repository
+        """
+        current_commit = self._get_last_commit()
+        graph = self._read_commit_graph()
+        
+        while current_commit:
+            try:
+                commit_data = graph.get(current_commit)
+                if commit_data is None:
+                    # Commits made before the commit-graph existed
+                    commit_data = self._read_commit(current_commit)
+                
+                bloom = commit_data.get('bloom', _FULL_BLOOM)
+                if _bloom_maybe_contains(bloom, path) and self._commit_changed_path(current_commit, path):
+                    print(f"Commit: {current_commit}")
+                    print(f"Message: {commit_data['message']}")
+                    print(f"Timestamp: {commit_data['timestamp']}")
+                    print("---")
+                
+                current_commit = commit_data.get('parent')
+            except FileNotFoundError:
+                break
+    
+    def _commit_changed_path(self, commit_hash: str, path: str) -> bool:
+        """
+        Check if a commit changed a file, ruling out Bloom filter false positives.
+        
+        :param commit_hash: Hash of the commit
+        :param path: Path of the file, relative to the repository
+        :return: True if the commit stored new content for the file, False otherwise
+        """
+        commit_data = self._read_commit(commit_hash)
+        file_hash = next((file['hash'] for file in self._commit_files(commit_data) if file['path'] == path), None)
+        if file_hash is None:
+            return False
+        
+        parent = commit_data.get('parent')
+        if not parent:
+            return True
+        
+        parent_files = self._commit_files(self._read_commit(parent))
+        return all(file['path'] != path or file['hash'] != file_hash for file in parent_files)
+    
     def branch(self, branch_name: str):
         """
         Create a new branch from the current branch.
@@ -208,7 +1115,7 @@ class Repository:
         current_commit = self._get_last_commit()
         
         # Create branch reference
-        branch_path = os.path.join(self.repo_dir, 'refs', 'heads', branch_name)
+        branch_path = f"{self._heads_dir}/{branch_name}"
         with open(branch_path, 'w') as f:
             f.write(current_commit or '')
         
@@ -220,14 +1127,14 @@ class Repository:
         
         :param branch_name: Name of the branch to checkout
         """
-        branch_path = os.path.join(self.repo_dir, 'refs', 'heads', branch_name)
+        branch_path = f"{self._heads_dir}/{branch_name}"
         
         if not os.path.exists(branch_path):
             print(f"Branch {branch_name} does not exist")
             return
         
         # Update HEAD
-        with open(os.path.join(self.repo_dir, 'HEAD'), 'w') as f:
+        with open(self._head_path, 'w') as f:
             f.write(f'ref: refs/heads/{branch_name}')
         
         self.current_branch = branch_name
@@ -247,28 +1154,39 @@ class Repository:
             print("One or both branches have no commits")
             return
         
-        branch1_path = os.path.join(self.repo_dir, 'objects', branch1_commit)
-        branch2_path = os.path.join(self.repo_dir, 'objects', branch2_commit)
+        branch1_data = self._read_commit(branch1_commit)
+        branch2_data = self._read_commit(branch2_commit)
         
-        with open(branch1_path, 'r') as f:
-            branch1_data = json.load(f)
+        print(f"Diff between {branch1} and {branch2}:")
         
-        with open(branch2_path, 'r') as f:
-            branch2_data = json.load(f)
+        if branch1_data.get('tree') is not None and branch1_data.get('tree') == branch2_data.get('tree'):
+            # Identical trees, no need to load them
+            return
         
-        branch1_files = {file['path']: file['hash'] for file in branch1_data['files']}
-        branch2_files = {file['path']: file['hash'] for file in branch2_data['files']}
+        branch1_files = self._commit_files(branch1_data)
+        branch2_files = self._commit_files(branch2_data)
         
-        print(f"Diff between {branch1} and {branch2}:")
+        # Find added, removed, and modified files by walking both sorted lists
+        i = j = 0
+        while i < len(branch1_files) and j < len(branch2_files):
+            file1 = branch1_files[i]
+            file2 = branch2_files[j]
+            if file1['path'] == file2['path']:
+                if file1['hash'] != file2['hash']:
+                    print(f"Modified: {file1['path']}")
+                i += 1
+                j += 1
+            elif file1['path'] < file2['path']:
+                print(f"Removed: {file1['path']}")
+                i += 1
+            else:
+                print(f"Added: {file2['path']}")
+                j += 1
         
-        # Find added, removed, and modified files
-        for path in set(list(branch1_files.keys()) + list(branch2_files.keys())):
-            if path not in branch1_files:
-                print(f"Added: {path}")
-            elif path not in branch2_files:
-                print(f"Removed: {path}")
-            elif branch1_files[path] != branch2_files[path]:
-                print(f"Modified: {path}")
+        for file in branch1_files[i:]:
+            print(f"Removed: {file['path']}")
+        for file in branch2_files[j:]:
+            print(f"Added: {file['path']}")
     
     def _get_branch_last_commit(self, branch_name: str) -> Optional[str]:
         """
@@ -277,7 +1195,7 @@ class Repository:
         :param branch_name: Name of the branch
         :return: Commit hash or None if no commits
         """
-        branch_path = os.path.join(self.repo_dir, 'refs', 'heads', branch_name)
+        branch_path = f"{self._heads_dir}/{branch_name}"
         
         try:
             with open(branch_path, 'r') as f:
@@ -291,7 +1209,25 @@ class Repository:
         
         :param destination: Path to clone the repository
         """
-        shutil.copytree(self.path, destination)
+        # Objects are only ever replaced by rename, never modified in place,
+        # so the clone can share them through hard links
+        objects_dir = os.path.join(self.path, '.gitclone', 'objects')
+        
+        for root, _, files in os.walk(self.path, followlinks=True):
+            target_dir = os.path.join(destination, os.path.relpath(root, self.path))
+            os.makedirs(target_dir)
+            
+            for name in files:
+                src = os.path.join(root, name)
+                dest = os.path.join(target_dir, name)
+                if root == objects_dir:
+                    try:
+                        os.link(src, dest)
+                        continue
+                    except OSError:
+                        pass
+                _reflink_or_copy(src, dest)
+        
         print(f"Cloned repository to {destination}")
 
 def main():